@@ -50,6 +50,8 @@ if sys.implementation.name == 'circuitpython' and sys.implementation.version[0]
         "This release is not compatible with CircuitPython 4.x; use library release 1.x.x")
 #pylint: enable=wrong-import-position
 
+import struct
+
 import board
 import _bleio
 
@@ -59,30 +61,64 @@ from .advertising import Advertisement
 __version__ = "0.0.0-auto.0"
 __repo__ = "https://github.com/adafruit/Adafruit_CircuitPython_BLE.git"
 
+def _build_prefixes(*, service_uuids=(), manufacturer_ids=()):
+    """Builds scan prefixes that match advertising structures starting with one of the given
+       service UUIDs or manufacturer company ids."""
+    prefixes = bytearray()
+    for uuid in service_uuids:
+        if hasattr(uuid, "uuid"):
+            uuid = uuid.uuid
+        uuid_length = uuid.size // 8
+        encoded = bytearray(uuid_length)
+        uuid.pack_into(encoded)
+        # 16-bit UUIDs are listed in ADTs 0x02 (incomplete) and 0x03 (complete). 128-bit UUIDs use
+        # 0x06 and 0x07.
+        first_adt = 0x02 if uuid_length == 2 else 0x06
+        for adt in (first_adt, first_adt + 1):
+            prefixes.append(1 + uuid_length)
+            prefixes.append(adt)
+            prefixes.extend(encoded)
+    for company_id in manufacturer_ids:
+        prefixes.extend(struct.pack("<BBH", 3, 0xff, company_id))
+    return bytes(prefixes)
+
 class BLEConnection:
     """
     Represents a connection to a peer BLE device.
     It acts as a map from a `Service` type to a `Service` instance for the connection.
 
     :param bleio_connection _bleio.Connection: the native `_bleio.Connection` object to wrap
+    :param dict service_cache: maps `_bleio.UUID` objects to whether the peer provides them. It
+        outlives the connection so that reconnecting to the same peer can skip discovery.
+        ``None`` to always discover.
 
     """
-    def __init__(self, bleio_connection):
+    def __init__(self, bleio_connection, *, service_cache=None):
         self._bleio_connection = bleio_connection
-        # _bleio.Service objects representing services found during discovery.
-        self._discovered_bleio_services = {}
+        # _bleio.Service objects representing services found during discovery keyed by their
+        # _bleio.UUID. None until discovery has been done.
+        self._discovered_bleio_services = None
         # Service objects that wrap remote services.
         self._constructed_services = {}
+        self._service_cache = service_cache
+
+    def _discover_all(self):
+        """Discovers every remote service in one exchange so later lookups don't need another."""
+        self._discovered_bleio_services = {}
+        for service in self._bleio_connection.discover_remote_services():
+            self._discovered_bleio_services[service.uuid] = service
+            if self._service_cache is not None:
+                self._service_cache[service.uuid] = True
 
     def _discover_remote(self, uuid):
-        remote_service = None
-        if uuid in self._discovered_bleio_services:
-            remote_service = self._discovered_bleio_services[uuid]
-        else:
-            results = self._bleio_connection.discover_remote_services((uuid.bleio_uuid,))
-            if results:
-                remote_service = results[0]
-                self._discovered_bleio_services[uuid] = remote_service
+        bleio_uuid = uuid.bleio_uuid
+        if self._discovered_bleio_services is None:
+            if self._service_cache is not None and not self._service_cache.get(bleio_uuid, True):
+                return None
+            self._discover_all()
+        remote_service = self._discovered_bleio_services.get(bleio_uuid)
+        if self._service_cache is not None:
+            self._service_cache[bleio_uuid] = remote_service is not None
         return remote_service
 
     def __contains__(self, key):
@@ -101,6 +137,8 @@ class BLEConnection:
         uuid = key
         if hasattr(key, "uuid"):
             uuid = key.uuid
+        if self._service_cache is not None and uuid.bleio_uuid in self._service_cache:
+            return self._service_cache[uuid.bleio_uuid]
         return self._discover_remote(uuid) is not None
 
     def __getitem__(self, key):
@@ -139,14 +177,24 @@ class BLERadio:
     scanning for advertisements, and connecting to peers. There may be
     multiple connections active at once.
 
-    It uses this library's `Advertisement` classes and the `BLEConnection` class."""
+    It uses this library's `Advertisement` classes and the `BLEConnection` class.
 
-    def __init__(self, adapter=None):
+    :param _bleio.Adapter adapter: the adapter to use. Defaults to `_bleio.adapter`.
+    :param bool dangerous_cache_services: When True, remember which services each peer connected
+        to with `connect` provides so that later connections to the same address skip discovery
+        when checking for a service. This is unsafe if the peer's firmware can change between
+        connections."""
+
+    def __init__(self, adapter=None, *, dangerous_cache_services=False):
         if not adapter:
             adapter = _bleio.adapter
         self._adapter = adapter
         self._current_advertisement = None
         self._connection_cache = {}
+        # Maps peer address bytes to the service cache of its connections.
+        self._service_cache = None
+        if dangerous_cache_services:
+            self._service_cache = {}
 
     def start_advertising(self, advertisement, scan_response=None, interval=0.1):
         """
@@ -158,7 +206,10 @@ class BLERadio:
         """
         scan_response_data = None
         if scan_response:
-            scan_response_data = bytes(scan_response)
+            if isinstance(scan_response, (bytes, bytearray, memoryview)):
+                scan_response_data = scan_response
+            else:
+                scan_response_data = bytes(scan_response)
         self._adapter.start_advertising(bytes(advertisement),
                                         scan_response=scan_response_data,
                                         connectable=advertisement.connectable,
@@ -169,7 +220,9 @@ class BLERadio:
         self._adapter.stop_advertising()
 
     def start_scan(self, *advertisement_types, buffer_size=512, extended=False, timeout=None,
-                   interval=0.1, window=0.1, minimum_rssi=-80, active=True):
+                   interval=0.1, window=0.1, minimum_rssi=-80, active=True,
+                   filter_duplicates=False, max_dedupe_entries=20, service_uuids=None,
+                   manufacturer_ids=None, name_contains=None):
         """
         Starts scanning. Returns an iterator of advertisement objects of the types given in
         advertisement_types. The iterator will block until an advertisement is heard or the scan
@@ -181,6 +234,13 @@ class BLERadio:
 
         Advertisements and scan responses are filtered and returned separately.
 
+        When an advertisement matches more than one of the ``advertisement_types``, the first
+        matching type is produced unless a later matching type is a subclass of it.
+
+        ``service_uuids`` and ``manufacturer_ids`` are turned into prefixes for the native scan
+        so unwanted packets can be dropped before they reach Python. When several filters are
+        given an advertisement must pass all of them.
+
         :param int buffer_size: the maximum number of advertising bytes to buffer.
         :param bool extended: When True, support extended advertising packets.
             Increasing buffer_size is recommended when this is set.
@@ -193,23 +253,63 @@ class BLERadio:
              window must be <= interval.
         :param int minimum_rssi: the minimum rssi of entries to return.
         :param bool active: request and retrieve scan responses for scannable advertisements.
+        :param bool filter_duplicates: When True, skip advertisements whose address and data are
+            identical to one recently produced. Useful in crowded areas where the same packet is
+            heard many times. Leave False if repeated RSSI readings are needed.
+        :param int max_dedupe_entries: the number of recent advertisements remembered when
+            ``filter_duplicates`` is True.
+        :param iterable service_uuids: only produce advertisements whose service list starts with
+            one of these UUIDs or `Service` classes.
+        :param iterable manufacturer_ids: only produce advertisements with manufacturer data from
+            one of these company ids.
+        :param str name_contains: only produce advertisements whose name contains this string.
         :return: If any ``advertisement_types`` are given,
            only Advertisements of those types are produced by the returned iterator.
            If none are given then `Advertisement` objects will be returned.
         :rtype: iterable
         """
+        # pylint: disable=too-many-locals,too-many-branches
+        service_prefixes = None
+        if service_uuids:
+            service_prefixes = _build_prefixes(service_uuids=service_uuids)
+        manufacturer_prefixes = None
+        if manufacturer_ids:
+            manufacturer_prefixes = _build_prefixes(manufacturer_ids=manufacturer_ids)
+        # The native scan accepts a packet when any prefix matches so only one kind of filter is
+        # passed down. The others are checked below.
         prefixes = b""
         if advertisement_types:
             prefixes = b"".join(adv.prefix for adv in advertisement_types)
+        elif service_prefixes:
+            prefixes = service_prefixes
+        elif manufacturer_prefixes:
+            prefixes = manufacturer_prefixes
+        recent = []
         for entry in self._adapter.start_scan(prefixes=prefixes, buffer_size=buffer_size,
                                               extended=extended, timeout=timeout,
                                               interval=interval, window=window,
                                               minimum_rssi=minimum_rssi, active=active):
+            if service_prefixes and not entry.matches(service_prefixes, all=False):
+                continue
+            if manufacturer_prefixes and not entry.matches(manufacturer_prefixes, all=False):
+                continue
+            if filter_duplicates:
+                # Skip repeats before doing any decoding work for them.
+                key = (entry.address.address_bytes, entry.advertisement_bytes)
+                if key in recent:
+                    continue
+                recent.append(key)
+                if len(recent) > max_dedupe_entries:
+                    recent.pop(0)
             adv_type = Advertisement
             for possible_type in advertisement_types:
                 if possible_type.matches(entry) and issubclass(possible_type, adv_type):
                     adv_type = possible_type
             advertisement = adv_type.from_entry(entry)
+            if name_contains is not None:
+                name = advertisement.complete_name or advertisement.short_name
+                if name is None or name_contains not in name:
+                    continue
             if advertisement:
                 yield advertisement
 
@@ -230,7 +330,14 @@ class BLERadio:
         :rtype: BLEConnection
         """
         connection = self._adapter.connect(advertisement.address, timeout=timeout)
-        self._connection_cache[connection] = BLEConnection(connection)
+        self._clean_connection_cache()
+        service_cache = None
+        if self._service_cache is not None:
+            address_bytes = advertisement.address.address_bytes
+            if address_bytes not in self._service_cache:
+                self._service_cache[address_bytes] = {}
+            service_cache = self._service_cache[address_bytes]
+        self._connection_cache[connection] = BLEConnection(connection, service_cache=service_cache)
         return self._connection_cache[connection]
 
     @property
@@ -241,11 +348,19 @@ class BLERadio:
     @property
     def connections(self):
         """A tuple of active `BLEConnection` objects."""
-        connections = self._adapter.connections
-        wrapped_connections = [None] * len(connections)
-        for i, connection in enumerate(self._adapter.connections):
-            if connection not in self._connection_cache:
-                self._connection_cache[connection] = BLEConnection(connection)
-            wrapped_connections[i] = self._connection_cache[connection]
+        self._clean_connection_cache()
+        # Each read of the adapter's connections allocates a new tuple so only read it once.
+        connection_cache = self._connection_cache
+        wrapped_connections = []
+        for connection in self._adapter.connections:
+            if connection not in connection_cache:
+                connection_cache[connection] = BLEConnection(connection)
+            wrapped_connections.append(connection_cache[connection])
 
         return tuple(wrapped_connections)
+
+    def _clean_connection_cache(self):
+        """Removes cached wrappers of connections that are no longer connected."""
+        for connection in list(self._connection_cache):
+            if not connection.connected:
+                del self._connection_cache[connection]
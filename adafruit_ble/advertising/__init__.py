@@ -33,56 +33,186 @@ def to_bytes_literal(seq):
     """Prints a byte sequence as a Python bytes literal that only uses hex encoding."""
     return "b\"" + "".join("\\x{:02x}".format(v) for v in seq) + "\""
 
+# CircuitPython's struct has no precompiled Struct so remember the sizes of the key encodings
+# instead of recomputing them for every packet.
+_KEY_SIZES = {"B": 1, "<H": 2}
+
+def _key_size(key_encoding):
+    size = _KEY_SIZES.get(key_encoding)
+    if size is None:
+        size = struct.calcsize(key_encoding)
+        _KEY_SIZES[key_encoding] = size
+    return size
+
 def decode_data(data, *, key_encoding="B"):
     """Helper which decodes length encoded structures into a dictionary with the given key
        encoding."""
     i = 0
     data_dict = {}
-    key_size = struct.calcsize(key_encoding)
-    while i < len(data):
+    data_length = len(data)
+    key_size = _key_size(key_encoding)
+    while i < data_length:
         item_length = data[i]
         i += 1
-        if item_length == 0:
+        # Stop at the end marker or at a corrupt or truncated structure rather than reading past
+        # the end of the buffer.
+        if item_length == 0 or item_length < key_size or i + item_length > data_length:
             break
-        key = struct.unpack_from(key_encoding, data, i)[0]
-        value = data[i + key_size:i + item_length]
-        if key in data_dict:
-            if not isinstance(data_dict[key], list):
-                data_dict[key] = [data_dict[key]]
-            data_dict[key].append(value)
+        # Read the common key encodings directly rather than going through struct.
+        if key_encoding == "B":
+            key = data[i]
+        elif key_encoding == "<H":
+            key = data[i] | data[i + 1] << 8
         else:
+            key = struct.unpack_from(key_encoding, data, i)[0]
+        value = data[i + key_size:i + item_length]
+        existing = data_dict.get(key)
+        if existing is None:
             data_dict[key] = value
+        elif isinstance(existing, tuple):
+            # Repeated keys are rare so growing the tuple each time is cheaper than a list.
+            data_dict[key] = existing + (value,)
+        else:
+            data_dict[key] = (existing, value)
         i += item_length
     return data_dict
 
+def _find_ad_type(data, adt):
+    """Returns the offset of the first structure of the given advertising data type in the raw
+       advertising data, or -1 if there isn't one. Nothing is allocated so presence checks are
+       cheap."""
+    i = 0
+    data_length = len(data)
+    while i < data_length:
+        item_length = data[i]
+        if item_length == 0 or i + 1 + item_length > data_length:
+            break
+        if data[i + 1] == adt:
+            return i
+        i += 1 + item_length
+    return -1
+
+def _get_field(advertisement, adt):
+    """Returns the value of the given advertising data type, or None if it isn't present, without
+       decoding the data dictionary of a scanned advertisement. When the type is repeated the
+       first value is returned, whether or not the data dictionary has been decoded."""
+    # pylint: disable=protected-access
+    if advertisement._data_dict is not None:
+        value = advertisement._data_dict.get(adt)
+        if isinstance(value, tuple):
+            return value[0]
+        return value
+    data = advertisement._raw_bytes
+    i = _find_ad_type(data, adt)
+    if i < 0:
+        return None
+    return data[i + 2:i + 1 + data[i]]
+
+def _has_field(advertisement, adt):
+    """Returns True if the advertisement contains the given advertising data type."""
+    # pylint: disable=protected-access
+    if advertisement._data_dict is not None:
+        return adt in advertisement._data_dict
+    return _find_ad_type(advertisement._raw_bytes, adt) >= 0
+
 def compute_length(data_dict, *, key_encoding="B"):
     """Computes the length of the encoded data dictionary."""
     value_size = 0
     for value in data_dict.values():
-        if isinstance(value, list):
+        if isinstance(value, (tuple, list)):
             for subv in value:
                 value_size += len(subv)
         else:
             value_size += len(value)
-    return len(data_dict) + len(data_dict) * struct.calcsize(key_encoding) + value_size
+    return len(data_dict) + len(data_dict) * _key_size(key_encoding) + value_size
 
 def encode_data(data_dict, *, key_encoding="B"):
     """Helper which encodes dictionaries into length encoded structures with the given key
        encoding."""
-    length = compute_length(data_dict, key_encoding=key_encoding)
-    data = bytearray(length)
-    key_size = struct.calcsize(key_encoding)
-    i = 0
+    data = bytearray()
+    key_size = _key_size(key_encoding)
     for key, value in data_dict.items():
-        if isinstance(value, list):
-            value = b"".join(value)
-        item_length = key_size + len(value)
-        struct.pack_into("B", data, i, item_length)
-        struct.pack_into(key_encoding, data, i + 1, key)
-        data[i + 1 + key_size: i + 1 + item_length] = bytes(value)
-        i += 1 + item_length
+        if not isinstance(value, (bytes, bytearray)):
+            if isinstance(value, (tuple, list)):
+                # Values of keys repeated in decoded data.
+                value = b"".join(value)
+            else:
+                # Bound objects such as AdvertisingFlags encode themselves.
+                value = bytes(value)
+        data.append(key_size + len(value))
+        if key_encoding == "B":
+            data.append(key)
+        elif key_encoding == "<H":
+            data.append(key & 0xff)
+            data.append(key >> 8)
+        else:
+            data.extend(struct.pack(key_encoding, key))
+        data.extend(value)
     return data
 
+# Attribute names found by _class_attributes keyed by class and attribute type.
+_CLASS_ATTRIBUTES = {}
+
+def _class_attributes(cls, attribute_type):
+    """Returns the names of the class attributes that are instances of attribute_type. dir() is
+       slow so each class is only searched once."""
+    key = (cls, attribute_type)
+    names = _CLASS_ATTRIBUTES.get(key)
+    if names is None:
+        names = tuple(attr for attr in dir(cls)
+                      if issubclass(getattr(cls, attr).__class__, attribute_type))
+        _CLASS_ATTRIBUTES[key] = names
+    return names
+
+class _DataDict(dict):
+    """Dictionary of advertising data that forgets its advertisement's cached encoding whenever it
+       is changed. Every dict method that changes the contents is overridden."""
+    def __init__(self, advertisement, data=None):
+        super().__init__()
+        self._advertisement = advertisement
+        if data:
+            # Loading the initial data doesn't change the encoding.
+            super().update(data)
+
+    def _changed(self):
+        self._advertisement._cached_bytes = None # pylint: disable=protected-access
+
+    def _bind(self, key, value):
+        """Replaces the data for key with an object that encodes to the same data, so the cached
+           encoding is kept."""
+        super().__setitem__(key, value)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._changed()
+        return item
+
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self._changed()
+        return value
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
 class AdvertisingDataField:
     """Top level class for any descriptor classes that live in Advertisement or its subclasses."""
 
@@ -111,16 +241,34 @@ class AdvertisingFlags(AdvertisingDataField):
     """BR/EDR not supported."""
     # BR/EDR flags not included here, since we don't support BR/EDR.
 
+    # Name and bitmask of each flag above, used to print them all in one pass. The bitmasks come
+    # from the descriptors so the two can't disagree.
+    # pylint: disable=protected-access
+    _FLAG_TABLE = (("limited_discovery", limited_discovery._bitmask),
+                   ("general_discovery", general_discovery._bitmask),
+                   ("le_only", le_only._bitmask))
+    # pylint: enable=protected-access
+
     def __init__(self, advertisement, advertising_data_type):
         self._advertisement = advertisement
         self._adt = advertising_data_type
-        self.flags = None
+        # Set _flags directly because loading the flags doesn't change the encoding.
         if self._adt in self._advertisement.data_dict:
-            self.flags = self._advertisement.data_dict[self._adt][0]
+            self._flags = self._advertisement.data_dict[self._adt][0]
         elif self._advertisement.mutable:
-            self.flags = 0b110 # Default to General discovery and LE Only
+            self._flags = 0b110 # Default to General discovery and LE Only
         else:
-            self.flags = 0
+            self._flags = 0
+
+    @property
+    def flags(self):
+        """The flags as an integer bitmask."""
+        return self._flags
+
+    @flags.setter
+    def flags(self, value):
+        self._flags = value
+        self._advertisement._cached_bytes = None # pylint: disable=protected-access
 
     def __len__(self):
         return 1
@@ -132,11 +280,10 @@ class AdvertisingFlags(AdvertisingDataField):
 
     def __str__(self):
         parts = ["<AdvertisingFlags"]
-        for attr in dir(self.__class__):
-            attribute_instance = getattr(self.__class__, attr)
-            if issubclass(attribute_instance.__class__, AdvertisingFlag):
-                if getattr(self, attr):
-                    parts.append(attr)
+        flags = self._flags
+        for name, bitmask in self._FLAG_TABLE:
+            if flags & bitmask:
+                parts.append(name)
         parts.append(">")
         return " ".join(parts)
 
@@ -148,9 +295,10 @@ class String(AdvertisingDataField):
         self._adt = advertising_data_type
 
     def __get__(self, obj, cls):
-        if self._adt not in obj.data_dict:
+        value = _get_field(obj, self._adt)
+        if value is None:
             return None
-        return str(obj.data_dict[self._adt], "utf-8")
+        return str(value, "utf-8")
 
     def __set__(self, obj, value):
         obj.data_dict[self._adt] = value.encode("utf-8")
@@ -162,9 +310,10 @@ class Struct(AdvertisingDataField):
         self._adt = advertising_data_type
 
     def __get__(self, obj, cls):
-        if self._adt not in obj.data_dict:
+        value = _get_field(obj, self._adt)
+        if value is None:
             return None
-        return struct.unpack(self._format, obj.data_dict[self._adt])[0]
+        return struct.unpack(self._format, value)[0]
 
     def __set__(self, obj, value):
         obj.data_dict[self._adt] = struct.pack(self._format, value)
@@ -180,11 +329,16 @@ class LazyField(AdvertisingDataField):
 
     def __get__(self, obj, cls):
         # Return None if our object is immutable and the data is not present.
-        if not obj.mutable and self._adt not in obj.data_dict:
+        if not obj.mutable and not _has_field(obj, self._adt):
             return None
         bound_class = self._cls(obj, advertising_data_type=self._adt, **self._kwargs)
         setattr(obj, self._attribute_name, bound_class)
-        obj.data_dict[self._adt] = bound_class
+        data_dict = obj.data_dict
+        if self._adt in data_dict:
+            # The bound object is built from the existing data so the encoding doesn't change.
+            data_dict._bind(self._adt, bound_class) # pylint: disable=protected-access
+        else:
+            data_dict[self._adt] = bound_class
         return bound_class
 
     # TODO: Add __set_name__ support to CircuitPython so that we automatically tell the descriptor
@@ -226,7 +380,12 @@ class Advertisement:
           if supplied, create a packet with supplied data. This is usually used
           to parse an existing packet.
         """
-        self.data_dict = {}
+        self._data_dict = _DataDict(self)
+        # Received packet bytes of a scanned advertisement. They are only decoded into _data_dict
+        # once the whole dictionary is needed.
+        self._raw_bytes = None
+        # Encoded packet bytes, reused until the data changes.
+        self._cached_bytes = None
         self.address = None
         self._rssi = None
         self.connectable = False
@@ -237,15 +396,32 @@ class Advertisement:
     def from_entry(cls, entry):
         """Create an Advertisement based on the given ScanEntry. This is done automatically by
            `BLERadio` for all scan results."""
+        # pylint: disable=protected-access
         self = cls()
-        self.data_dict = decode_data(entry.advertisement_bytes)
+        self._raw_bytes = entry.advertisement_bytes
+        self._data_dict = None
+        self._cached_bytes = entry.advertisement_bytes
         self.address = entry.address
-        self._rssi = entry.rssi # pylint: disable=protected-access
+        self._rssi = entry.rssi
         self.connectable = entry.connectable
         self.scan_response = entry.scan_response
         self.mutable = False
         return self
 
+    @property
+    def data_dict(self):
+        """Dictionary of the advertising data structures keyed by advertising data type."""
+        if self._data_dict is None:
+            # Scanned advertisements keep the bytes they were received with until changed.
+            self._data_dict = _DataDict(self, decode_data(self._raw_bytes))
+        return self._data_dict
+
+    @data_dict.setter
+    def data_dict(self, value):
+        # Copy into a _DataDict so that later changes also clear the cached encoding.
+        self._data_dict = _DataDict(self, value)
+        self._cached_bytes = None
+
     @property
     def rssi(self):
         """Signal strength of the scanned advertisement. Only available on Advertisement's created
@@ -256,28 +432,25 @@ class Advertisement:
     def matches(cls, entry):
         """Returns true if the given `_bleio.ScanEntry` matches all portions of the Advertisement
            type's prefix."""
-        if not hasattr(cls, "prefix"):
-            return True
-
         return entry.matches(cls.prefix)
 
     def __bytes__(self):
         """The raw packet bytes."""
-        return encode_data(self.data_dict)
+        if self._cached_bytes is None:
+            self._cached_bytes = bytes(encode_data(self.data_dict))
+        return self._cached_bytes
 
     def __str__(self):
         parts = ["<" + self.__class__.__name__]
-        for attr in dir(self.__class__):
-            attribute_instance = getattr(self.__class__, attr)
-            if issubclass(attribute_instance.__class__, AdvertisingDataField):
-                value = getattr(self, attr)
-                if value is not None:
-                    parts.append(attr + "=" + str(value))
+        for attr in _class_attributes(self.__class__, AdvertisingDataField):
+            value = getattr(self, attr)
+            if value is not None:
+                parts.append(attr + "=" + str(value))
         parts.append(">")
         return " ".join(parts)
 
     def __len__(self):
-        return compute_length(self.data_dict)
+        return len(bytes(self))
 
     def __repr__(self):
-        return "Advertisement(data={})".format(to_bytes_literal(encode_data(self.data_dict)))
+        return "Advertisement(data={})".format(to_bytes_literal(bytes(self)))
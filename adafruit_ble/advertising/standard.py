@@ -31,6 +31,7 @@ even though multiple purposes may actually be present in a single packet.
 import struct
 
 from . import Advertisement, AdvertisingDataField, encode_data, decode_data, to_hex, compute_length
+from . import _has_field, _DataDict
 from ..uuid import StandardUUID, VendorUUID
 
 __version__ = "0.0.0-auto.0"
@@ -44,15 +45,16 @@ class BoundServiceList:
         self._vendor_service_fields = vendor_services
         self._standard_services = []
         self._vendor_services = []
+        data_dict = advertisement.data_dict
         for adt in standard_services:
-            if adt in self._advertisement.data_dict:
-                data = self._advertisement.data_dict[adt]
+            data = data_dict.get(adt)
+            if data is not None:
                 for i in range(len(data) // 2):
                     uuid = StandardUUID(data[2*i:2*(i+1)])
                     self._standard_services.append(uuid)
         for adt in vendor_services:
-            if adt in self._advertisement.data_dict:
-                data = self._advertisement.data_dict[adt]
+            data = data_dict.get(adt)
+            if data is not None:
                 for i in range(len(data) // 16):
                     uuid = VendorUUID(data[16*i:16*(i+1)])
                     self._vendor_services.append(uuid)
@@ -122,10 +124,10 @@ class ServiceList(AdvertisingDataField):
 
     def _present(self, obj):
         for adt in self.standard_services:
-            if adt in obj.data_dict:
+            if _has_field(obj, adt):
                 return True
         for adt in self.vendor_services:
-            if adt in obj.data_dict:
+            if _has_field(obj, adt):
                 return True
         return False
 
@@ -179,28 +181,46 @@ class ManufacturerData:
         self._company_id = company_id
         self._adt = advertising_data_type
 
-        self.data = {}
-        self.company_id = company_id
         encoded_company = struct.pack('<H', company_id)
-        if 0xff in obj.data_dict:
-            existing_data = obj.data_dict[0xff]
-            if isinstance(existing_data, list):
-                for existing in existing_data:
-                    if existing.startswith(encoded_company):
-                        existing_data = existing
-                existing_data = None
-            self.data = decode_data(existing_data[2:], key_encoding=key_encoding)
+        existing_data = obj.data_dict.get(0xff)
+        if isinstance(existing_data, tuple):
+            # Several manufacturers' data was advertised so use the one for our company.
+            matching_data = None
+            for existing in existing_data:
+                if existing[:2] == encoded_company:
+                    matching_data = existing
+                    break
+            existing_data = matching_data
+        if existing_data is not None:
+            existing_data = decode_data(existing_data[2:], key_encoding=key_encoding)
+        # Changes to the data clear the advertisement's cached encoding.
+        self._data = _DataDict(obj, existing_data)
         self._key_encoding = key_encoding
 
+    @property
+    def company_id(self):
+        """The company identifier of the manufacturer."""
+        return self._company_id
+
+    @company_id.setter
+    def company_id(self, value):
+        self._company_id = value
+        self._obj._cached_bytes = None # pylint: disable=protected-access
+
+    @property
+    def data(self):
+        """Dictionary of the manufacturer specific data keyed by the configured key format."""
+        return self._data
+
     def __len__(self):
-        return 2 + compute_length(self.data, key_encoding=self._key_encoding)
+        return 2 + compute_length(self._data, key_encoding=self._key_encoding)
 
     def __bytes__(self):
         return (struct.pack('<H', self.company_id) +
-                encode_data(self.data, key_encoding=self._key_encoding))
+                encode_data(self._data, key_encoding=self._key_encoding))
 
     def __str__(self):
-        hex_data = to_hex(encode_data(self.data, key_encoding=self._key_encoding))
+        hex_data = to_hex(encode_data(self._data, key_encoding=self._key_encoding))
         return "<ManufacturerData company_id={:04x} data={} >".format(self.company_id, hex_data)
 
 class ManufacturerDataField:
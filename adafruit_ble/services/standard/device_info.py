@@ -55,6 +55,24 @@ from ...characteristics.string import FixedStringCharacteristic
 __version__ = "0.0.0-auto.0"
 __repo__ = "https://github.com/adafruit/Adafruit_CircuitPython_BLE.git"
 
+# The chip's UID and firmware version never change so they are only formatted once.
+_DEFAULT_SERIAL_NUMBER = None
+_DEFAULT_FIRMWARE_REVISION = None
+
+def _default_serial_number():
+    """Returns the hex encoded chip UID."""
+    global _DEFAULT_SERIAL_NUMBER # pylint: disable=global-statement
+    if _DEFAULT_SERIAL_NUMBER is None:
+        _DEFAULT_SERIAL_NUMBER = binascii.hexlify(microcontroller.cpu.uid).decode('utf-8') # pylint: disable=no-member
+    return _DEFAULT_SERIAL_NUMBER
+
+def _default_firmware_revision():
+    """Returns the running firmware's version."""
+    global _DEFAULT_FIRMWARE_REVISION # pylint: disable=global-statement
+    if _DEFAULT_FIRMWARE_REVISION is None:
+        _DEFAULT_FIRMWARE_REVISION = os.uname().version
+    return _DEFAULT_FIRMWARE_REVISION
+
 class DeviceInfoService(Service):
     """Device information"""
     uuid = StandardUUID(0x180a)
@@ -74,10 +92,9 @@ class DeviceInfoService(Service):
         if model_number is None:
             model_number = sys.platform
         if serial_number is None:
-            serial_number = binascii.hexlify(microcontroller.cpu.uid).decode('utf-8') # pylint: disable=no-member
-
+            serial_number = _default_serial_number()
         if firmware_revision is None:
-            firmware_revision = os.uname().version
+            firmware_revision = _default_firmware_revision()
         super().__init__(manufacturer=manufacturer,
                          software_revision=software_revision,
                          model_number=model_number,
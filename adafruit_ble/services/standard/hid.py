@@ -28,8 +28,6 @@ BLE Human Interface Device (HID)
 * Author(s): Dan Halbert for Adafruit Industries
 
 """
-import struct
-
 from micropython import const
 
 import _bleio
@@ -50,6 +48,9 @@ _HID_INFORMATION_UUID_NUM = const(0x2A4A)
 _HID_CONTROL_POINT_UUID_NUM = const(0x2A4C)
 _REPORT_REF_DESCR_UUID_NUM = const(0x2908)
 _REPORT_REF_DESCR_UUID = _bleio.UUID(_REPORT_REF_DESCR_UUID_NUM)
+# Shared by every input and output report.
+_REPORT_UUID = StandardUUID(_REPORT_UUID_NUM)
+_REPORT_BLEIO_UUID = _REPORT_UUID.bleio_uuid
 _PROTOCOL_MODE_UUID_NUM = const(0x2A4E)
 
 _APPEARANCE_HID_KEYBOARD = const(961)
@@ -71,51 +72,51 @@ _REPORT_TYPE_OUTPUT = const(2)
 _PROTOCOL_MODE_BOOT = b'\x00'
 _PROTOCOL_MODE_REPORT = b'\x01'
 
+def _add_report_characteristic(service, report_id, report_type, *, properties, write_perm,
+                               max_length):
+    """Adds a report characteristic and its report reference descriptor to the service."""
+    characteristic = _bleio.Characteristic.add_to_service(
+        service.bleio_service,
+        _REPORT_BLEIO_UUID,
+        properties=properties,
+        read_perm=Attribute.ENCRYPT_NO_MITM, write_perm=write_perm,
+        max_length=max_length, fixed_length=True)
+
+    _bleio.Descriptor.add_to_characteristic(
+        characteristic, _REPORT_REF_DESCR_UUID,
+        read_perm=Attribute.ENCRYPT_NO_MITM, write_perm=Attribute.NO_ACCESS,
+        initial_value=bytes((report_id, report_type)))
+    return characteristic
+
 class ReportIn:
     """A single HID report that transmits HID data into a client."""
-    uuid = StandardUUID(0x24ad)
+    uuid = _REPORT_UUID
     def __init__(self, service, report_id, usage_page, usage, *, max_length):
-        self._characteristic = _bleio.Characteristic.add_to_service(
-            service.bleio_service,
-            self.uuid.bleio_uuid,
+        self._characteristic = _add_report_characteristic(
+            service, report_id, _REPORT_TYPE_INPUT,
             properties=Characteristic.READ | Characteristic.NOTIFY,
-            read_perm=Attribute.ENCRYPT_NO_MITM, write_perm=Attribute.NO_ACCESS,
-            max_length=max_length, fixed_length=True)
+            write_perm=Attribute.NO_ACCESS, max_length=max_length)
         self._report_id = report_id
         self.usage_page = usage_page
         self.usage = usage
 
-        _bleio.Descriptor.add_to_characteristic(
-            self._characteristic, _REPORT_REF_DESCR_UUID,
-            read_perm=Attribute.ENCRYPT_NO_MITM, write_perm=Attribute.NO_ACCESS,
-            initial_value=struct.pack('<BB', self._report_id, _REPORT_TYPE_INPUT))
-
     def send_report(self, report):
         """Send a report to the peers"""
         self._characteristic.value = report
 
 class ReportOut:
     """A single HID report that receives HID data from a client."""
-    uuid = StandardUUID(0x24ad)
+    uuid = _REPORT_UUID
     def __init__(self, service, report_id, usage_page, usage, *, max_length):
-        self._characteristic = Characteristic.add_to_service(
-            service.bleio_service,
-            self.uuid.bleio_uuid,
-            max_length=max_length,
-            fixed_length=True,
+        self._characteristic = _add_report_characteristic(
+            service, report_id, _REPORT_TYPE_OUTPUT,
             properties=(Characteristic.READ | Characteristic.WRITE |
                         Characteristic.WRITE_NO_RESPONSE),
-            read_perm=Attribute.ENCRYPT_NO_MITM, write_perm=Attribute.ENCRYPT_NO_MITM
-        )
+            write_perm=Attribute.ENCRYPT_NO_MITM, max_length=max_length)
         self._report_id = report_id
         self.usage_page = usage_page
         self.usage = usage
 
-        _bleio.Descriptor.add_to_characteristic(
-            self._characteristic, _REPORT_REF_DESCR_UUID,
-            read_perm=Attribute.ENCRYPT_NO_MITM, write_perm=Attribute.NO_ACCESS,
-            initial_value=struct.pack('<BB', self._report_id, _REPORT_TYPE_OUTPUT))
-
 _ITEM_TYPE_MAIN = const(0)
 _ITEM_TYPE_GLOBAL = const(1)
 _ITEM_TYPE_LOCAL = const(2)
@@ -126,6 +127,93 @@ _MAIN_ITEM_TAG_INPUT = const(0b1000)
 _MAIN_ITEM_TAG_OUTPUT = const(0b1001)
 _MAIN_ITEM_TAG_FEATURE = const(0b1011)
 
+# Data sizes in bytes indexed by the size bits of an item's prefix.
+_ITEM_SIZE = (0, 1, 2, 4)
+
+def _parse_descriptor(hid_descriptor):
+    """Returns a list of (report_id, usage_page, usage, input_size, output_size) tuples, one for
+       each top level collection in the HID descriptor. Sizes are in bits."""
+    # pylint: disable=too-many-branches,too-many-statements,too-many-locals
+    reports = []
+
+    # Item data is decoded to an int once so the tables hold ints and are updated in place.
+    global_table = [None] * 10
+    local_table = [None] * 3
+    # Report sizes are totalled as the descriptor is walked instead of building a tree of
+    # collections. Only the usage and report of the current top level collection are kept.
+    depth = 0
+    usage_page = None
+    usage = None
+    # Only one report id is supported per top level collection so its input and output sizes, in
+    # bits, are plain totals. The id may be None so has_report tracks whether it has been set.
+    has_report = False
+    collection_report_id = None
+    input_size = 0
+    output_size = 0
+    # The item constants are inlined by const() but globals are looked up on every use.
+    item_size = _ITEM_SIZE
+    descriptor_length = len(hid_descriptor)
+
+    i = 0
+    while i < descriptor_length:
+        b = hid_descriptor[i]
+        tag = b >> 4
+        _type = (b >> 2) & 0b11
+        size = item_size[b & 0b11]
+        # Item data is little endian and follows the prefix byte. Decode the common short sizes by
+        # hand.
+        if size == 1:
+            value = hid_descriptor[i + 1]
+        elif size == 2:
+            value = hid_descriptor[i + 1] | hid_descriptor[i + 2] << 8
+        elif size == 4:
+            value = int.from_bytes(hid_descriptor[i + 1:i + 5], "little")
+        else:
+            value = 0
+        i += 1 + size
+        if _type == _ITEM_TYPE_GLOBAL:
+            global_table[tag] = value
+        elif _type == _ITEM_TYPE_MAIN:
+            if tag == _MAIN_ITEM_TAG_START_COLLECTION:
+                if depth == 0:
+                    # Fail before reading the rest of an unsupported collection.
+                    if value != 1:
+                        raise NotImplementedError(
+                            "Only Application top level collections supported.")
+                    usage_page = global_table[0]
+                    usage = local_table[0]
+                    has_report = False
+                    collection_report_id = None
+                    input_size = 0
+                    output_size = 0
+                depth += 1
+            elif tag == _MAIN_ITEM_TAG_END_COLLECTION:
+                depth -= 1
+                # The top level collection is complete so record its report.
+                if depth == 0:
+                    reports.append((collection_report_id, usage_page, usage, input_size,
+                                    output_size))
+            elif tag in (_MAIN_ITEM_TAG_INPUT, _MAIN_ITEM_TAG_OUTPUT):
+                report_size = global_table[7]
+                report_id = global_table[8]
+                report_count = global_table[9]
+                if not has_report:
+                    has_report = True
+                    collection_report_id = report_id
+                elif report_id != collection_report_id:
+                    raise NotImplementedError(
+                        "Only on report id per Application collection supported")
+                if tag == _MAIN_ITEM_TAG_INPUT:
+                    input_size += report_size * report_count
+                else:
+                    output_size += report_size * report_count
+            else:
+                raise RuntimeError("Unsupported main item in HID descriptor")
+            local_table[0] = local_table[1] = local_table[2] = None
+        else:
+            local_table[tag] = value
+    return reports
+
 class HIDService(Service):
     """
     Provide devices for HID over BLE.
@@ -193,96 +281,29 @@ class HIDService(Service):
 
     def __init__(self, hid_descriptor):
         super().__init__(report_map=hid_descriptor)
-        self._init_devices()
-
-    def _init_devices(self):
-        # pylint: disable=too-many-branches,too-many-statements,too-many-locals
+        # Parse the descriptor we were given instead of reading it back from the characteristic.
+        self._init_devices(hid_descriptor)
+
+    def _init_devices(self, report_map):
+        """Creates the report devices described by the report map. The report map is only read
+           here so this must be called again if it changes."""
+        if not isinstance(report_map, (bytes, bytearray, memoryview)):
+            report_map = bytes(report_map)
         self.devices = []
-        hid_descriptor = self.report_map
-
-        global_table = [None] * 10
-        local_table = [None] * 3
-        collections = []
-        top_level_collections = []
-
-        i = 0
-        while i < len(hid_descriptor):
-            b = hid_descriptor[i]
-            tag = (b & 0xf0) >> 4
-            _type = (b & 0b1100) >> 2
-            size = b & 0b11
-            size = 4 if size == 3 else size
-            i += 1
-            data = hid_descriptor[i:i+size]
-            if _type == _ITEM_TYPE_GLOBAL:
-                global_table[tag] = data
-            elif _type == _ITEM_TYPE_MAIN:
-                if tag == _MAIN_ITEM_TAG_START_COLLECTION:
-                    collections.append({"type": data,
-                                        "locals": list(local_table),
-                                        "globals": list(global_table),
-                                        "mains": []})
-                elif tag == _MAIN_ITEM_TAG_END_COLLECTION:
-                    collection = collections.pop()
-                    # This is a top level collection if the collections list is now empty.
-                    if not collections:
-                        top_level_collections.append(collection)
-                    else:
-                        collections[-1]["mains"].append(collection)
-                elif tag == _MAIN_ITEM_TAG_INPUT:
-                    collections[-1]["mains"].append({"tag": "input",
-                                                     "locals": list(local_table),
-                                                     "globals": list(global_table)})
-                elif tag == _MAIN_ITEM_TAG_OUTPUT:
-                    collections[-1]["mains"].append({"tag": "output",
-                                                     "locals": list(local_table),
-                                                     "globals": list(global_table)})
-                else:
-                    raise RuntimeError("Unsupported main item in HID descriptor")
-                local_table = [None] * 3
-            else:
-                local_table[tag] = data
-
-            i += size
-
-        def get_report_info(collection, reports):
-            for main in collection["mains"]:
-                if "type" in main:
-                    get_report_info(main, reports)
-                else:
-                    report_size, report_id, report_count = [x[0] for x in main["globals"][7:10]]
-                    if report_id not in reports:
-                        reports[report_id] = {"input_size": 0, "output_size": 0}
-                    if main["tag"] == "input":
-                        reports[report_id]["input_size"] += report_size * report_count
-                    elif main["tag"] == "output":
-                        reports[report_id]["output_size"] += report_size * report_count
-
-
-        for collection in top_level_collections:
-            if collection["type"][0] != 1:
-                raise NotImplementedError("Only Application top level collections supported.")
-            usage_page = collection["globals"][0][0]
-            usage = collection["locals"][0][0]
-            reports = {}
-            get_report_info(collection, reports)
-            if len(reports) > 1:
-                raise NotImplementedError("Only on report id per Application collection supported")
-
-            report_id, report = list(reports.items())[0]
-            output_size = report["output_size"]
+        for report_id, usage_page, usage, input_size, output_size in _parse_descriptor(
+                report_map):
+            # HID over GATT identifies each report characteristic by a report reference holding
+            # one report id and one report type, so a report with both input and output data
+            # needs two characteristics. They share the report UUID and setup code.
             if output_size > 0:
                 self.devices.append(ReportOut(self, report_id, usage_page, usage,
-                                              max_length=output_size // 8))
-
-            input_size = reports[report_id]["input_size"]
+                                              max_length=output_size >> 3))
             if input_size > 0:
                 self.devices.append(ReportIn(self, report_id, usage_page, usage,
-                                             max_length=input_size // 8))
-
+                                             max_length=input_size >> 3))
 
     @classmethod
     def from_remote_service(cls, remote_service):
         """Creates a HIDService from a remote service"""
         self = super(cls).from_remote_service(remote_service)
-        self._init_devices() # pylint: disable=protected-access
+        self._init_devices(self.report_map) # pylint: disable=protected-access